@@ -7,14 +7,28 @@ import os
 import argparse
 from datetime import datetime, timezone, timedelta
 
-import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Rows per server-side fetch and per Parquet row group
+BATCH_SIZE = 50_000
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('route_id', pa.string()),
+    ('stop_id', pa.string()),
+    ('trip_id', pa.string()),
+    ('delay_seconds', pa.int64()),
+    ('vehicle_id', pa.string()),
+    ('recorded_at', pa.timestamp('us', tz='UTC')),
+])
+
 
 def export_to_parquet(days_old: int, output_dir: str = "archives"):
     """Export records older than X days to Parquet."""
@@ -26,34 +40,55 @@ def export_to_parquet(days_old: int, output_dir: str = "archives"):
 
     conn = psycopg2.connect(DATABASE_URL)
     try:
-        # Count records to export
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT COUNT(*) FROM bus_delays WHERE recorded_at < %s",
-                (cutoff_date,)
-            )
-            count = cur.fetchone()[0]
-
-        if count == 0:
-            print(f"No records older than {days_old} days found.")
-            return None, 0
+        print(f"Exporting records older than {days_old} days...")
 
-        print(f"Exporting {count:,} records older than {days_old} days...")
-
-        # Read data into pandas DataFrame
         query = """
-            SELECT id, route_id, stop_id, trip_id, delay_seconds, vehicle_id, recorded_at
+            SELECT id::text, route_id, stop_id, trip_id, delay_seconds, vehicle_id, recorded_at
             FROM bus_delays
             WHERE recorded_at < %s
             ORDER BY recorded_at
         """
-        df = pd.read_sql(query, conn, params=(cutoff_date,))
 
-        # Save as Parquet (compressed)
-        df.to_parquet(filename, compression='snappy', index=False)
+        # Named cursor = server-side cursor, so only one row-group batch is
+        # in memory at a time instead of the whole result set.
+        cur = conn.cursor(name='archive_cur')
+        cur.itersize = BATCH_SIZE
+        cur.execute(query, (cutoff_date,))
+
+        # zstd level 3 compresses 30-50% smaller than snappy at similar
+        # write throughput — the archive's dominant cost is storage, not CPU.
+        writer = pq.ParquetWriter(
+            filename, ARCHIVE_SCHEMA,
+            compression='zstd',
+            compression_level=3,
+            use_dictionary=True,
+            write_statistics=True,
+        )
+        count = 0
+        try:
+            while True:
+                rows = cur.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                count += len(rows)
+                columns = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(col, type=field.type)
+                     for col, field in zip(columns, ARCHIVE_SCHEMA)],
+                    schema=ARCHIVE_SCHEMA,
+                )
+                writer.write_batch(batch)
+        finally:
+            writer.close()
+            cur.close()
+
+        if count == 0:
+            os.remove(filename)
+            print(f"No records older than {days_old} days found.")
+            return None, 0
 
         file_size_mb = os.path.getsize(filename) / (1024 * 1024)
-        print(f"Exported to: {filename} ({file_size_mb:.1f} MB)")
+        print(f"Exported {count:,} records to: {filename} ({file_size_mb:.1f} MB)")
         return filename, count
     finally:
         conn.close()
@@ -78,18 +113,46 @@ def delete_old_records(days_old: int):
         conn.close()
 
 
-def get_stats():
-    """Get current database statistics."""
+def get_stats(exact: bool = False):
+    """Get current database statistics.
+
+    Uses the optimizer's estimated row count by default — COUNT(*) is a
+    full scan that gets slower as the table grows. Pass exact=True (the
+    --exact flag) for the precise count.
+    """
     conn = psycopg2.connect(DATABASE_URL)
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM bus_delays")
-            total = cur.fetchone()[0]
+            total = None
+            if not exact:
+                try:
+                    # O(1) on CockroachDB vs an O(rows) COUNT(*) scan
+                    cur.execute(
+                        "SELECT estimated_row_count FROM crdb_internal.table_row_statistics "
+                        "WHERE table_name = 'bus_delays'"
+                    )
+                    row = cur.fetchone()
+                    total = row[0] if row else None
+                except psycopg2.Error:
+                    conn.rollback()
+                    cur.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE relname = 'bus_delays'"
+                    )
+                    row = cur.fetchone()
+                    total = row[0] if row else None
+
+            # reltuples is -1 on never-analyzed tables (PG 14+) and 0 on
+            # fresh ones — treat anything non-positive as "no estimate"
+            if total is None or total <= 0:
+                cur.execute("SELECT COUNT(*) FROM bus_delays")
+                total = cur.fetchone()[0]
+                exact = True
 
             cur.execute("SELECT MIN(recorded_at), MAX(recorded_at) FROM bus_delays")
             min_date, max_date = cur.fetchone()
 
-            print(f"Total records: {total:,}")
+            suffix = "" if exact else " (estimated)"
+            print(f"Total records: {total:,}{suffix}")
             print(f"Date range: {min_date} to {max_date}")
             return total, min_date, max_date
     finally:
@@ -101,12 +164,13 @@ def main():
     parser.add_argument("--days", type=int, default=30, help="Archive records older than X days (default: 30)")
     parser.add_argument("--delete", action="store_true", help="Delete records after export")
     parser.add_argument("--stats", action="store_true", help="Show database statistics only")
+    parser.add_argument("--exact", action="store_true", help="Use exact COUNT(*) for --stats (slow on large tables)")
     parser.add_argument("--output-dir", default="archives", help="Output directory for Parquet files")
 
     args = parser.parse_args()
 
     if args.stats:
-        get_stats()
+        get_stats(exact=args.exact)
         return
 
     # Export
@@ -4,25 +4,101 @@ Backfill road conditions data from DriveBC API.
 
 Fetches ARCHIVED events from Open511-DriveBC API for a specified date range.
 """
+import csv
+import io
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psycopg2
 from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Shared session: reuses the TCP+TLS connection across paginated fetches
+# and retries transient failures with backoff.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(max_retries=Retry(
+    total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]
+)))
+SESSION.headers.update({'Accept-Encoding': 'gzip'})
+
 DRIVEBC_API_URL = "https://api.open511.gov.bc.ca/events"
 METRO_VANCOUVER_BBOX = "-124.5,48.0,-121.0,50.0"
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Pages fetched concurrently per round (bounded to stay polite to the API)
+FETCH_CONCURRENCY = 8
+
+# Below this batch size, forking a process pool costs more than it saves
+PARSE_POOL_THRESHOLD = 2000
+
+ROAD_COLUMNS = (
+    "event_id, status, severity, event_type, event_subtype, "
+    "headline, description, road_name, direction, "
+    "lat, lon, created_at, updated_at, collected_at"
+)
+
+STAGE_COPY_SQL = (
+    f"COPY road_conditions_stage ({ROAD_COLUMNS}) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+STAGE_UPSERT_SQL = f"""
+    INSERT INTO road_conditions ({ROAD_COLUMNS})
+    SELECT {ROAD_COLUMNS} FROM road_conditions_stage
+    ON CONFLICT (event_id, updated_at) DO UPDATE SET
+        status = EXCLUDED.status,
+        severity = EXCLUDED.severity,
+        collected_at = EXCLUDED.collected_at
+"""
+
+
+def _copy_buffer(records):
+    """Render record tuples as an in-memory CSV for COPY FROM STDIN."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+    for row in records:
+        writer.writerow(['\\N' if v is None else v for v in row])
+    buf.seek(0)
+    return buf
+
+
+# Cheap shape check so bad strings are rejected by a C regex match
+# instead of raising/catching ValueError on the hot path
+ISO_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]')
+
+# One connection reused across save_to_db calls (archived + active batches)
+_CONN = None
 
+
+def get_connection():
+    """Return the shared DB connection, reconnecting if it was closed."""
+    global _CONN
+    if _CONN is None or _CONN.closed:
+        _CONN = psycopg2.connect(DATABASE_URL)
+    return _CONN
+
+
+def close_connection():
+    global _CONN
+    if _CONN is not None and not _CONN.closed:
+        _CONN.close()
+    _CONN = None
+
+
+@lru_cache(maxsize=4096)
 def parse_datetime(dt_str: Optional[str]) -> Optional[datetime]:
-    """Parse datetime string from API."""
-    if not dt_str:
+    """Parse datetime string from API (cached; timestamps repeat within batches)."""
+    if not dt_str or not ISO_DATETIME_RE.match(dt_str):
         return None
     try:
         return datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
@@ -30,38 +106,53 @@ def parse_datetime(dt_str: Optional[str]) -> Optional[datetime]:
         return None
 
 
+def fetch_page(start_date: str, offset: int, limit: int) -> list:
+    """Fetch a single page of archived events."""
+    params = {
+        "status": "ARCHIVED",
+        "bbox": METRO_VANCOUVER_BBOX,
+        "created": f">{start_date}",
+        "limit": limit,
+        "offset": offset,
+        "format": "json",
+    }
+
+    response = SESSION.get(DRIVEBC_API_URL, params=params, timeout=60)
+    response.raise_for_status()
+    # orjson decodes the large paginated payloads 2-5x faster than stdlib json
+    return orjson.loads(response.content).get("events", [])
+
+
 def fetch_archived_events(start_date: str) -> list:
-    """Fetch all archived events since start_date using pagination."""
+    """Fetch all archived events since start_date using pagination.
+
+    Pages are independent, so each round fetches FETCH_CONCURRENCY
+    offsets in parallel instead of waiting one network RTT per page.
+    """
     all_events = []
     offset = 0
     limit = 500
 
-    while True:
-        params = {
-            "status": "ARCHIVED",
-            "bbox": METRO_VANCOUVER_BBOX,
-            "created": f">{start_date}",
-            "limit": limit,
-            "offset": offset,
-            "format": "json",
-        }
-
-        print(f"  Fetching offset {offset}...")
-        response = requests.get(DRIVEBC_API_URL, params=params, timeout=60)
-        response.raise_for_status()
-        data = response.json()
-
-        events = data.get("events", [])
-        if not events:
-            break
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+        while True:
+            offsets = [offset + i * limit for i in range(FETCH_CONCURRENCY)]
+            print(f"  Fetching offsets {offsets[0]}-{offsets[-1]}...")
+            pages = list(executor.map(
+                lambda o: fetch_page(start_date, o, limit), offsets
+            ))
 
-        all_events.extend(events)
-        print(f"    Got {len(events)} events (total: {len(all_events)})")
+            done = False
+            for page in pages:
+                all_events.extend(page)
+                if len(page) < limit:
+                    done = True
+                    break
 
-        if len(events) < limit:
-            break
+            print(f"    Total so far: {len(all_events)}")
+            if done:
+                break
 
-        offset += limit
+            offset += FETCH_CONCURRENCY * limit
 
     return all_events
 
@@ -109,15 +200,23 @@ def save_to_db(events: list) -> int:
     if not events:
         return 0
 
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = get_connection()
     cur = conn.cursor()
 
     collected_at = datetime.now(timezone.utc)
 
     try:
+        # parse_event is pure Python (dict walks + ISO datetime parsing), so
+        # large backfill batches are parsed across cores; parse_event takes
+        # and returns plain dicts, so it pickles cheaply.
+        if len(events) >= PARSE_POOL_THRESHOLD:
+            with ProcessPoolExecutor() as executor:
+                parsed = list(executor.map(parse_event, events, chunksize=256))
+        else:
+            parsed = [parse_event(event) for event in events]
+
         records = []
-        for event in events:
-            e = parse_event(event)
+        for e in parsed:
             records.append((
                 e['event_id'],
                 e['status'],
@@ -135,25 +234,39 @@ def save_to_db(events: list) -> int:
                 collected_at,
             ))
 
-        sql = """
-            INSERT INTO road_conditions (
-                event_id, status, severity, event_type, event_subtype,
-                headline, description, road_name, direction,
-                lat, lon, created_at, updated_at, collected_at
-            ) VALUES %s
-            ON CONFLICT (event_id, updated_at) DO UPDATE SET
-                status = EXCLUDED.status,
-                severity = EXCLUDED.severity,
-                collected_at = EXCLUDED.collected_at
-        """
-
-        execute_values(cur, sql, records, page_size=500)
-        conn.commit()
+        # Commits are deferred to main(), so guard the staging attempt
+        # with a savepoint — a full rollback on failure would discard the
+        # uncommitted batches saved before this call.
+        cur.execute("SAVEPOINT road_stage_attempt")
+        try:
+            # COPY the batch into a temp staging table in one stream, then
+            # resolve conflicts with a single INSERT ... SELECT ... ON CONFLICT.
+            # Commits are deferred to main(), so the stage persists between
+            # batches — create once and clear it each time.
+            cur.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS road_conditions_stage "
+                "(LIKE road_conditions INCLUDING DEFAULTS)"
+            )
+            cur.execute("DELETE FROM road_conditions_stage")
+            cur.copy_expert(STAGE_COPY_SQL, _copy_buffer(records))
+            cur.execute(STAGE_UPSERT_SQL)
+            cur.execute("RELEASE SAVEPOINT road_stage_attempt")
+        except psycopg2.Error:
+            # Temp tables / COPY can be restricted on some CockroachDB
+            # deployments; undo just this attempt and fall back to the
+            # batched upsert.
+            cur.execute("ROLLBACK TO SAVEPOINT road_stage_attempt")
+            execute_values(cur, f"""
+                INSERT INTO road_conditions ({ROAD_COLUMNS}) VALUES %s
+                ON CONFLICT (event_id, updated_at) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    severity = EXCLUDED.severity,
+                    collected_at = EXCLUDED.collected_at
+            """, records, page_size=500)
 
         return len(records)
     finally:
         cur.close()
-        conn.close()
 
 
 def main():
@@ -195,14 +308,18 @@ def main():
         "bbox": METRO_VANCOUVER_BBOX,
         "format": "json",
     }
-    response = requests.get(DRIVEBC_API_URL, params=params, timeout=30)
+    response = SESSION.get(DRIVEBC_API_URL, params=params, timeout=30)
     response.raise_for_status()
-    active_events = response.json().get("events", [])
+    active_events = orjson.loads(response.content).get("events", [])
 
     if active_events:
         saved = save_to_db(active_events)
         print(f"Saved {saved} active events")
 
+    # Single commit for the whole run — the upserts are idempotent, so a
+    # mid-run failure just means re-running the backfill.
+    get_connection().commit()
+    close_connection()
     print("\nDone!")
 
 
@@ -3,18 +3,34 @@
 Backfill weather data from Environment Canada SWOB API.
 Fetches historical data from a specified start date to now.
 """
+import csv
+import io
 import os
+import re
 import ssl
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 from urllib.parse import urlparse
 
+import ijson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import psycopg2
 from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Shared session: reuses the TCP+TLS connection across the day-by-day
+# fetch loop and retries transient failures with backoff.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(max_retries=Retry(
+    total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]
+)))
+SESSION.headers.update({'Accept-Encoding': 'gzip'})
+
 # Metro Vancouver & surrounding area SWOB stations (15 stations)
 STATIONS = [
     {"id": "1100119", "name": "AGASSIZ RCS"},
@@ -34,10 +50,91 @@ STATIONS = [
     {"id": "1018598", "name": "VICTORIA UNIVERSITY CS"},
 ]
 
-VALID_STATION_IDS = {s["id"] for s in STATIONS}
+# station_id -> canonical name; also serves as the membership filter
+STATION_NAMES = {s["id"]: s["name"] for s in STATIONS}
 SWOB_API_URL = "https://api.weather.gc.ca/collections/swob-realtime/items"
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Day windows fetched concurrently (bounded per-host, the API is I/O-bound)
+FETCH_CONCURRENCY = 8
+
+# Commit once per this many saved batches instead of per batch — the
+# backfill is idempotent (ON CONFLICT DO UPDATE), so losing uncommitted
+# batches on a crash only means re-running them.
+COMMIT_EVERY = 25
+
+WEATHER_COLUMNS = (
+    "station_id, station_name, recorded_at, lat, lon, "
+    "temperature_c, humidity_percent, wind_speed_kmh, "
+    "wind_direction, pressure_hpa, visibility_km, "
+    "precipitation_mm, collected_at"
+)
+
+STAGE_COPY_SQL = (
+    f"COPY weather_stage ({WEATHER_COLUMNS}) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+STAGE_UPSERT_SQL = f"""
+    INSERT INTO weather ({WEATHER_COLUMNS})
+    SELECT {WEATHER_COLUMNS} FROM weather_stage
+    ON CONFLICT (station_id, recorded_at) DO UPDATE SET
+        temperature_c = EXCLUDED.temperature_c,
+        humidity_percent = EXCLUDED.humidity_percent,
+        wind_speed_kmh = EXCLUDED.wind_speed_kmh,
+        wind_direction = EXCLUDED.wind_direction,
+        pressure_hpa = EXCLUDED.pressure_hpa,
+        visibility_km = EXCLUDED.visibility_km,
+        precipitation_mm = EXCLUDED.precipitation_mm,
+        collected_at = EXCLUDED.collected_at
+"""
+
+UPSERT_SQL = f"""
+    INSERT INTO weather ({WEATHER_COLUMNS}) VALUES %s
+    ON CONFLICT (station_id, recorded_at) DO UPDATE SET
+        temperature_c = EXCLUDED.temperature_c,
+        humidity_percent = EXCLUDED.humidity_percent,
+        wind_speed_kmh = EXCLUDED.wind_speed_kmh,
+        wind_direction = EXCLUDED.wind_direction,
+        pressure_hpa = EXCLUDED.pressure_hpa,
+        visibility_km = EXCLUDED.visibility_km,
+        precipitation_mm = EXCLUDED.precipitation_mm,
+        collected_at = EXCLUDED.collected_at
+"""
+
+# Cheap shape check so bad strings never reach datetime.fromisoformat
+ISO_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]')
+
+# One connection reused across all save_to_db calls — a backfill used to
+# pay a fresh TLS handshake per 1-day window.
+_CONN = None
+
+
+def get_connection():
+    """Return the shared DB connection, reconnecting if it was closed."""
+    global _CONN
+    if _CONN is None or _CONN.closed:
+        _CONN = psycopg2.connect(DATABASE_URL)
+    return _CONN
+
+
+def close_connection():
+    global _CONN
+    if _CONN is not None and not _CONN.closed:
+        _CONN.close()
+    _CONN = None
+
+
+@lru_cache(maxsize=4096)
+def parse_obs_time(obs_time_str):
+    """Parse a SWOB observation time (cached; times repeat across stations)."""
+    if not obs_time_str or not ISO_DATETIME_RE.match(obs_time_str):
+        return None
+    try:
+        return datetime.fromisoformat(obs_time_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
 
 def fetch_historical_data(start_date: datetime, end_date: datetime) -> list:
     """Fetch historical weather data for a date range."""
@@ -55,60 +152,50 @@ def fetch_historical_data(start_date: datetime, end_date: datetime) -> list:
 
     print(f"Fetching data for {datetime_range}...")
 
-    response = requests.get(SWOB_API_URL, params=params, timeout=60)
+    # Stream-parse the response so features for the ~99% of stations we
+    # discard never become fully materialized Python dicts.
+    response = SESSION.get(SWOB_API_URL, params=params, timeout=60, stream=True)
     response.raise_for_status()
-    data = response.json()
+    response.raw.decode_content = True  # ijson reads the raw (gzip) stream
 
-    features = data.get("features", [])
-    print(f"  Got {len(features)} raw features")
+    raw_count = 0
 
     # Process and deduplicate by station + recorded_at
     station_data = {}
 
-    for feature in features:
+    for feature in ijson.items(response.raw, 'features.item'):
+        raw_count += 1
         props = feature.get("properties", {})
         coords = feature.get("geometry", {}).get("coordinates", [])
 
-        station_id = props.get("icao_stn_id-value") or props.get("msc_id-value", "")
-        station_name = props.get("stn_nam-value", "")
-
-        if not station_id or not coords:
-            continue
-
-        if station_id not in VALID_STATION_IDS:
+        station_id = props.get("icao_stn_id-value") or props.get("msc_id-value")
+        if station_id not in STATION_NAMES or not coords:
             continue
 
         # Parse observation time
-        obs_time_str = props.get("date_tm-value")
-        if obs_time_str:
-            try:
-                recorded_at = datetime.fromisoformat(obs_time_str.replace('Z', '+00:00'))
-            except:
-                continue
-        else:
+        recorded_at = parse_obs_time(props.get("date_tm-value"))
+        if recorded_at is None:
             continue
 
-        # Create unique key
-        key = (station_id, recorded_at.isoformat())
-
-        weather = {
-            'station_id': station_id,
-            'station_name': station_name,
-            'recorded_at': recorded_at,
-            'lat': coords[1] if len(coords) > 1 else None,
-            'lon': coords[0] if len(coords) > 0 else None,
-            'temperature_c': props.get("air_temp"),
-            'humidity_percent': props.get("rel_hum"),
-            'wind_speed_kmh': props.get("avg_wnd_spd_10m_pst10mts"),
-            'wind_direction': props.get("avg_wnd_dir_10m_pst2mts") or props.get("avg_wnd_dir_10m_pst10mts"),
-            'pressure_hpa': props.get("mslp"),
-            'visibility_km': props.get("avg_vis_pst10mts"),
-            'precipitation_mm': props.get("pcpn_amt_pst1hr"),
-        }
-
-        station_data[key] = weather
+        # datetime is hashable, so key on it directly (no isoformat string).
+        # Store a tuple in column order, ready for save_to_db.
+        station_data[(station_id, recorded_at)] = (
+            station_id,
+            STATION_NAMES[station_id],
+            recorded_at,
+            coords[1] if len(coords) > 1 else None,
+            coords[0] if len(coords) > 0 else None,
+            props.get("air_temp"),
+            props.get("rel_hum"),
+            props.get("avg_wnd_spd_10m_pst10mts"),
+            props.get("avg_wnd_dir_10m_pst2mts") or props.get("avg_wnd_dir_10m_pst10mts"),
+            props.get("mslp"),
+            props.get("avg_vis_pst10mts"),
+            props.get("pcpn_amt_pst1hr"),
+        )
 
     all_records = list(station_data.values())
+    print(f"  Got {raw_count} raw features")
     print(f"  Filtered to {len(all_records)} unique records for target stations")
 
     return all_records
@@ -119,58 +206,53 @@ def save_to_db(records: list) -> int:
     if not records:
         return 0
 
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = get_connection()
     cur = conn.cursor()
 
     collected_at = datetime.now(timezone.utc)
 
     try:
-        # Prepare data for batch insert
-        values = [
-            (
-                r['station_id'],
-                r['station_name'],
-                r['recorded_at'],
-                r['lat'],
-                r['lon'],
-                r['temperature_c'],
-                r['humidity_percent'],
-                r['wind_speed_kmh'],
-                r['wind_direction'],
-                r['pressure_hpa'],
-                r['visibility_km'],
-                r['precipitation_mm'],
-                collected_at,
+        # Commits are batched across save calls, so guard the staging
+        # attempt with a savepoint — a full rollback on failure would
+        # discard every previously saved uncommitted batch.
+        cur.execute("SAVEPOINT weather_stage_attempt")
+        try:
+            # COPY into a temp staging table (one stream, no per-row SQL),
+            # then resolve conflicts with a single set-based upsert.
+            # The staging table lives for the connection (commits are
+            # batched across save calls), so create once and clear per batch.
+            cur.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS weather_stage "
+                "(LIKE weather INCLUDING DEFAULTS)"
+            )
+            cur.execute("DELETE FROM weather_stage")
+            buf = io.StringIO()
+            writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+            # Records arrive as tuples in column order; collected_at is
+            # appended while writing so no intermediate row list is built.
+            for row in records:
+                writer.writerow(
+                    ['\\N' if v is None else v for v in row] + [collected_at]
+                )
+            buf.seek(0)
+            cur.copy_expert(STAGE_COPY_SQL, buf)
+            cur.execute(STAGE_UPSERT_SQL)
+            cur.execute("RELEASE SAVEPOINT weather_stage_attempt")
+        except psycopg2.Error:
+            # Temp tables / COPY can be restricted on some CockroachDB
+            # deployments; undo just this attempt and fall back to the
+            # batched upsert. execute_values accepts any iterable, so
+            # feed it a generator.
+            cur.execute("ROLLBACK TO SAVEPOINT weather_stage_attempt")
+            execute_values(
+                cur, UPSERT_SQL,
+                (r + (collected_at,) for r in records),
+                page_size=1000,
             )
-            for r in records
-        ]
-
-        # Upsert using ON CONFLICT
-        sql = """
-            INSERT INTO weather (
-                station_id, station_name, recorded_at, lat, lon,
-                temperature_c, humidity_percent, wind_speed_kmh,
-                wind_direction, pressure_hpa, visibility_km,
-                precipitation_mm, collected_at
-            ) VALUES %s
-            ON CONFLICT (station_id, recorded_at) DO UPDATE SET
-                temperature_c = EXCLUDED.temperature_c,
-                humidity_percent = EXCLUDED.humidity_percent,
-                wind_speed_kmh = EXCLUDED.wind_speed_kmh,
-                wind_direction = EXCLUDED.wind_direction,
-                pressure_hpa = EXCLUDED.pressure_hpa,
-                visibility_km = EXCLUDED.visibility_km,
-                precipitation_mm = EXCLUDED.precipitation_mm,
-                collected_at = EXCLUDED.collected_at
-        """
-
-        execute_values(cur, sql, values, page_size=1000)
-        conn.commit()
 
         return len(records)
     finally:
         cur.close()
-        conn.close()
 
 
 def main():
@@ -179,27 +261,48 @@ def main():
     end_date = datetime.now(timezone.utc)
 
     print(f"Backfilling weather data from {start_date} to {end_date}")
-    print(f"Target stations: {len(VALID_STATION_IDS)}")
+    print(f"Target stations: {len(STATION_NAMES)}")
     print()
 
     total_saved = 0
 
-    # Fetch in 1-day chunks to avoid API limits
+    # Build 1-day windows (the API limit applies per request); windows are
+    # independent, so fetch them concurrently and save from the main thread
+    # as each one completes.
+    windows = []
     current = start_date
     while current < end_date:
         chunk_end = min(current + timedelta(days=1), end_date)
-
-        try:
-            records = fetch_historical_data(current, chunk_end)
-            if records:
-                saved = save_to_db(records)
-                total_saved += saved
-                print(f"  Saved {saved} records")
-        except Exception as e:
-            print(f"  Error: {e}")
-
+        windows.append((current, chunk_end))
         current = chunk_end
 
+    batches_since_commit = 0
+    try:
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(fetch_historical_data, start, end): (start, end)
+                for start, end in windows
+            }
+            for future in as_completed(futures):
+                start, end = futures[future]
+                try:
+                    records = future.result()
+                    if records:
+                        saved = save_to_db(records)
+                        total_saved += saved
+                        batches_since_commit += 1
+                        if batches_since_commit >= COMMIT_EVERY:
+                            get_connection().commit()
+                            batches_since_commit = 0
+                        print(f"  Saved {saved} records for {start.date()}")
+                except Exception as e:
+                    print(f"  Error for {start.date()}: {e}")
+
+        if batches_since_commit:
+            get_connection().commit()
+    finally:
+        close_connection()
+
     print()
     print(f"Done! Total records saved: {total_saved}")
 
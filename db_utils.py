@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Shared CockroachDB connection pool for the collector scripts.
+
+Scripts that run standalone pay one handshake as before, but when
+several scripts are driven from the same Python process the pool
+amortizes the CockroachDB TLS handshake across them.
+"""
+import os
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Created lazily so importing this module never opens a connection
+_pool = None
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL environment variable is not set")
+        _pool = ThreadedConnectionPool(1, 4, DATABASE_URL)
+    return _pool
+
+
+@contextmanager
+def get_conn():
+    """Check a connection out of the shared pool for the duration of a block."""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
@@ -5,16 +5,18 @@ Export all CockroachDB tables to local CSV files.
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import psycopg2
-import pandas as pd
+from psycopg2 import sql
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 OUTPUT_DIR = "db_export"
+MAX_WORKERS = 4
 
 TABLES = [
     "bus_delays",
@@ -28,28 +30,71 @@ TABLES = [
     "stops",
 ]
 
-
-def export_table(conn, table_name: str, output_dir: str):
-    """Export a single table to CSV."""
+# Explicit column lists (matches import_all_data.TABLE_COLUMNS) so the
+# export never silently widens when columns are added server-side.
+TABLE_COLUMNS = {
+    "bus_delays": ["id", "route_id", "stop_id", "trip_id", "delay_seconds", "vehicle_id", "recorded_at", "collected_at"],
+    "weather": ["id", "station_id", "station_name", "recorded_at", "lat", "lon", "temperature_c", "humidity_percent", "wind_speed_kmh", "wind_direction", "pressure_hpa", "visibility_km", "precipitation_mm", "collected_at"],
+    "road_conditions": ["id", "event_id", "status", "severity", "event_type", "event_subtype", "headline", "description", "road_name", "direction", "lat", "lon", "created_at", "updated_at", "collected_at"],
+    "routes": ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"],
+    "trips": ["trip_id", "route_id", "service_id", "trip_headsign", "direction_id", "shape_id"],
+    "calendar": ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "start_date", "end_date"],
+    "calendar_dates": ["service_id", "date", "exception_type"],
+    "stop_times": ["trip_id", "stop_id", "arrival_time", "departure_time", "stop_sequence"],
+    "stops": ["stop_id", "stop_code", "stop_name", "stop_lat", "stop_lon", "zone_id"],
+}
+
+# Order the big time-series tables by their indexed timestamp column so
+# the server streams from the btree instead of sorting.
+TABLE_ORDER_BY = {
+    "bus_delays": "recorded_at",
+    "weather": "recorded_at",
+    "road_conditions": "created_at",
+}
+
+
+def export_table(table_name: str, output_dir: str):
+    """Export a single table to CSV via server-side COPY.
+
+    Opens its own connection so exports can run in parallel.
+    Returns (row_count, status message).
+    """
     filepath = os.path.join(output_dir, f"{table_name}.csv")
+
+    columns = TABLE_COLUMNS.get(table_name)
+    if columns:
+        select = sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+            sql.Identifier(table_name),
+        )
+        order_by = TABLE_ORDER_BY.get(table_name)
+        if order_by:
+            select = sql.SQL("{} ORDER BY {}").format(select, sql.Identifier(order_by))
+        copy_sql = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(select)
+    else:
+        copy_sql = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER true)").format(
+            sql.Identifier(table_name)
+        )
+    conn = psycopg2.connect(DATABASE_URL)
     try:
-        df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        row_count = len(df)
+        with conn.cursor() as cur, open(filepath, 'wb') as f:
+            # COPY streams rows from the backend straight to the file
+            # descriptor — no Python-level row objects.
+            cur.copy_expert(copy_sql, f)
+            row_count = cur.rowcount
         if row_count == 0:
-            print(f"  {table_name}: empty (skipped)")
-            return 0
-        df.to_csv(filepath, index=False)
+            os.remove(filepath)
+            return 0, f"  {table_name}: empty (skipped)"
         size_mb = os.path.getsize(filepath) / (1024 * 1024)
-        print(f"  {table_name}: {row_count:,} rows ({size_mb:.1f} MB)")
-        return row_count
+        return row_count, f"  {table_name}: {row_count:,} rows ({size_mb:.1f} MB)"
     except psycopg2.errors.UndefinedTable:
-        conn.rollback()
-        print(f"  {table_name}: table does not exist (skipped)")
-        return 0
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return 0, f"  {table_name}: table does not exist (skipped)"
     except Exception as e:
-        conn.rollback()
-        print(f"  {table_name}: ERROR - {e}")
-        return 0
+        return 0, f"  {table_name}: ERROR - {e}"
+    finally:
+        conn.close()
 
 
 def main():
@@ -59,15 +104,18 @@ def main():
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    print(f"Connecting to CockroachDB...")
-    conn = psycopg2.connect(DATABASE_URL)
-
     print(f"Exporting tables to {OUTPUT_DIR}/\n")
-    total_rows = 0
-    for table in TABLES:
-        total_rows += export_table(conn, table, OUTPUT_DIR)
 
-    conn.close()
+    # COPY-based dumps are network-bound and independent, so run them
+    # concurrently, one connection per worker. psycopg2 releases the GIL
+    # during network I/O so threads are enough.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda t: export_table(t, OUTPUT_DIR), TABLES))
+
+    total_rows = 0
+    for row_count, message in results:
+        total_rows += row_count
+        print(message)
 
     print(f"\nDone! Total: {total_rows:,} rows exported to {OUTPUT_DIR}/")
 
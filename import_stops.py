@@ -2,7 +2,9 @@
 """Import stops data from CSV to CockroachDB"""
 import os
 import csv
+import io
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -25,26 +27,66 @@ cur.execute('''
 conn.commit()
 print('stops table created')
 
-# Import data
-with open('stops.csv', 'r') as f:
-    reader = csv.DictReader(f)
-    count = 0
-    for row in reader:
-        cur.execute('''
-            INSERT INTO stops (stop_id, stop_code, stop_name, stop_lat, stop_lon, zone_id)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (stop_id) DO UPDATE SET
-                stop_code = EXCLUDED.stop_code,
-                stop_name = EXCLUDED.stop_name,
-                stop_lat = EXCLUDED.stop_lat,
-                stop_lon = EXCLUDED.stop_lon,
-                zone_id = EXCLUDED.zone_id;
-        ''', (row['stop_id'], row['stop_code'], row['stop_name'],
-              float(row['stop_lat']), float(row['stop_lon']), row['zone_id']))
-        count += 1
+STOP_COLUMNS = "stop_id, stop_code, stop_name, stop_lat, stop_lon, zone_id"
+
+UPSERT_SQL = f'''
+    INSERT INTO stops ({STOP_COLUMNS})
+    SELECT {STOP_COLUMNS} FROM stops_stage
+    ON CONFLICT (stop_id) DO UPDATE SET
+        stop_code = EXCLUDED.stop_code,
+        stop_name = EXCLUDED.stop_name,
+        stop_lat = EXCLUDED.stop_lat,
+        stop_lon = EXCLUDED.stop_lon,
+        zone_id = EXCLUDED.zone_id;
+'''
+
+
+def read_stop_rows():
+    """Yield (stop_id, stop_code, stop_name, stop_lat, stop_lon, zone_id)
+    tuples from stops.csv (the file has more columns than the table)."""
+    with open('stops.csv', 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        idx = [header.index(c) for c in
+               ('stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon', 'zone_id')]
+        for row in reader:
+            yield (row[idx[0]], row[idx[1]], row[idx[2]],
+                   float(row[idx[3]]), float(row[idx[4]]), row[idx[5]])
+
+
+# Import data: COPY the projected CSV into a temp staging table in one
+# stream, then resolve conflicts with a single set-based upsert — no
+# per-row round-trips.
+records = list(read_stop_rows())
+try:
+    cur.execute(
+        "CREATE TEMP TABLE stops_stage (LIKE stops INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+    for row in records:
+        writer.writerow(row)
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY stops_stage ({STOP_COLUMNS}) FROM STDIN WITH (FORMAT csv)", buf
+    )
+    cur.execute(UPSERT_SQL)
+except psycopg2.Error:
+    # COPY / temp tables can be restricted on some CockroachDB
+    # deployments; fall back to the batched upsert.
+    conn.rollback()
+    execute_values(cur, f'''
+        INSERT INTO stops ({STOP_COLUMNS}) VALUES %s
+        ON CONFLICT (stop_id) DO UPDATE SET
+            stop_code = EXCLUDED.stop_code,
+            stop_name = EXCLUDED.stop_name,
+            stop_lat = EXCLUDED.stop_lat,
+            stop_lon = EXCLUDED.stop_lon,
+            zone_id = EXCLUDED.zone_id;
+    ''', records, page_size=5000)
 
 conn.commit()
-print(f'{count} stops imported')
+print(f'{len(records)} stops imported')
 
 cur.close()
 conn.close()
@@ -3,13 +3,27 @@ DriveBC Road Conditions Collector - AWS Lambda
 Fetches road events from Open511-DriveBC API for Metro Vancouver.
 """
 import os
-import json
-import ssl
+import traceback
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from urllib.parse import urlparse
+from functools import lru_cache
+from typing import Optional
 
+import orjson
 import requests
-import pg8000
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import psycopg2
+from psycopg2.extras import execute_values
+
+# ciso8601 is a C tokenizer ~20x faster than datetime.fromisoformat and
+# handles the trailing 'Z' natively; fall back if the layer lacks it
+try:
+    from ciso8601 import parse_datetime as _parse_datetime
+except ImportError:
+    def _parse_datetime(s):
+        return datetime.fromisoformat(s.replace('Z', '+00:00'))
 
 # Open511-DriveBC API
 DRIVEBC_API_URL = "https://api.open511.gov.bc.ca/events"
@@ -17,23 +31,81 @@ DRIVEBC_API_URL = "https://api.open511.gov.bc.ca/events"
 # Metro Vancouver bounding box (same as weather data)
 METRO_VANCOUVER_BBOX = "-124.5,48.0,-121.0,50.0"
 
+# Environment is fixed for the container lifetime; read it once at import
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Module-level session: warm containers reuse the TCP+TLS connection,
+# and gzip shrinks the event payload considerably
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=2, pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+
+# Field order matches the road_conditions column list (minus collected_at),
+# so records feed straight into the batch insert without per-column lookups
+RoadEvent = namedtuple('RoadEvent', [
+    'event_id', 'status', 'severity', 'event_type', 'event_subtype',
+    'headline', 'description', 'road_name', 'direction',
+    'lat', 'lon', 'created_at', 'updated_at',
+])
+
+# Static upsert SQL, built once per container
+_UPSERT_EVENTS_SQL = '''
+    INSERT INTO road_conditions (
+        event_id, status, severity, event_type, event_subtype,
+        headline, description, road_name, direction,
+        lat, lon, created_at, updated_at, collected_at
+    ) VALUES %s
+    ON CONFLICT (event_id, updated_at) DO UPDATE SET
+        status = EXCLUDED.status,
+        severity = EXCLUDED.severity,
+        collected_at = EXCLUDED.collected_at
+'''
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso(s: Optional[str]) -> Optional[datetime]:
+    """Parse an Open511 timestamp (cached; many events share created/updated).
+
+    The cheap shape check keeps obvious non-timestamps off the parse fast
+    path; the narrow ValueError guard still catches shaped-but-invalid
+    values (e.g. out-of-range time fields) so one bad field can't fail
+    the whole invocation.
+    """
+    if not isinstance(s, str) or len(s) < 19 or s[4] != '-' or s[10] != 'T':
+        return None
+    try:
+        return _parse_datetime(s)
+    except ValueError:
+        return None
+
 
-def fetch_road_events() -> list:
-    """Fetch active road events from DriveBC API for Metro Vancouver."""
+def fetch_road_events():
+    """Fetch active road events from DriveBC API for Metro Vancouver.
+
+    Returns (events, by_type) — the per-type histogram is built in the
+    same pass as the parse instead of re-walking the list afterwards.
+    """
     params = {
         "status": "ACTIVE",
         "bbox": METRO_VANCOUVER_BBOX,
         "format": "json",
     }
 
-    response = requests.get(DRIVEBC_API_URL, params=params, timeout=30)
+    response = _SESSION.get(DRIVEBC_API_URL, params=params, timeout=30)
     response.raise_for_status()
-    data = response.json()
+    # orjson decodes the SWOB/DriveBC payloads 2-5x faster than stdlib json
+    data = orjson.loads(response.content)
 
     events = []
+    by_type = defaultdict(int)
     for event in data.get("events", []):
+        get = event.get  # hoist the bound method out of the field chain
+
         # Extract geography (point coordinates)
-        geography = event.get("geography", {})
+        geography = get("geography", {})
         coords = geography.get("coordinates", [])
 
         # Handle different geometry types
@@ -45,166 +117,149 @@ def fetch_road_events() -> list:
             lon, lat = coords[0][0], coords[0][1]
 
         # Extract road info
-        roads = event.get("roads", [])
+        roads = get("roads", [])
         road_name = roads[0].get("name") if roads else None
         direction = roads[0].get("direction") if roads else None
 
         # Extract event subtype
-        event_subtypes = event.get("event_subtypes", [])
+        event_subtypes = get("event_subtypes", [])
         event_subtype = event_subtypes[0] if event_subtypes else None
 
         # Parse timestamps
-        created_at = None
-        updated_at = None
-        if event.get("created"):
-            try:
-                created_at = datetime.fromisoformat(event["created"].replace('Z', '+00:00'))
-            except (ValueError, TypeError):
-                pass
-        if event.get("updated"):
-            try:
-                updated_at = datetime.fromisoformat(event["updated"].replace('Z', '+00:00'))
-            except (ValueError, TypeError):
-                pass
-
-        parsed_event = {
-            'event_id': event.get("id"),
-            'status': event.get("status"),
-            'severity': event.get("severity"),
-            'event_type': event.get("event_type"),
-            'event_subtype': event_subtype,
-            'headline': event.get("headline"),
-            'description': event.get("description"),
-            'road_name': road_name,
-            'direction': direction,
-            'lat': lat,
-            'lon': lon,
-            'created_at': created_at,
-            'updated_at': updated_at,
-        }
-
-        events.append(parsed_event)
-
-    return events
-
-
-def parse_database_url(database_url: str):
-    """Parse DATABASE_URL into pg8000 connection parameters."""
-    parsed = urlparse(database_url)
-    return {
-        'host': parsed.hostname,
-        'port': parsed.port or 26257,
-        'user': parsed.username,
-        'password': parsed.password,
-        'database': parsed.path.lstrip('/').split('?')[0],
-    }
-
-
-def save_events_batch(database_url: str, events: list, collected_at: datetime) -> int:
+        created_at = _parse_iso(get("created"))
+        updated_at = _parse_iso(get("updated"))
+
+        event_type = get("event_type")
+        events.append(RoadEvent(
+            event_id=get("id"),
+            status=get("status"),
+            severity=get("severity"),
+            event_type=event_type,
+            event_subtype=event_subtype,
+            headline=get("headline"),
+            description=get("description"),
+            road_name=road_name,
+            direction=direction,
+            lat=lat,
+            lon=lon,
+            created_at=created_at,
+            updated_at=updated_at,
+        ))
+        by_type[event_type or 'UNKNOWN'] += 1
+
+    return events, dict(by_type)
+
+
+# Verify the server certificate when the CockroachCloud root CA is
+# bundled in the deployment package; computed once per container.
+# 'require' still encrypts but skips verification.
+_CA_CERT = os.path.join(os.path.dirname(__file__), 'cc-ca.crt')
+_SSL_KWARGS = (
+    {'sslmode': 'verify-full', 'sslrootcert': _CA_CERT}
+    if os.path.exists(_CA_CERT) else {'sslmode': 'require'}
+)
+
+# Lambda reuses container instances, so the connection persists across
+# warm invocations — the TLS+auth handshake is only paid on cold start.
+_CONN = None
+
+
+def _get_conn(database_url: str):
+    global _CONN
+    if _CONN is None:
+        _CONN = _open_conn(database_url)
+    return _CONN
+
+
+def _reset_conn():
+    """Drop the cached connection (e.g. after an idle timeout)."""
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.close()
+        except Exception:
+            pass
+        _CONN = None
+
+
+def _open_conn(database_url: str):
+    """Open a CockroachDB connection (TLS handshake + auth)."""
+    return psycopg2.connect(database_url, **_SSL_KWARGS)
+
+
+def save_events_batch(conn, events: list, collected_at: datetime) -> int:
     """Save road events to CockroachDB using upsert."""
     if not events:
         return 0
 
-    params = parse_database_url(database_url)
-
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    conn = pg8000.connect(
-        host=params['host'],
-        port=params['port'],
-        user=params['user'],
-        password=params['password'],
-        database=params['database'],
-        ssl_context=ssl_context,
-    )
     cur = conn.cursor()
 
-    saved_count = 0
     try:
-        for e in events:
-            cur.execute('''
-                INSERT INTO road_conditions (
-                    event_id, status, severity, event_type, event_subtype,
-                    headline, description, road_name, direction,
-                    lat, lon, created_at, updated_at, collected_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (event_id, updated_at) DO UPDATE SET
-                    status = EXCLUDED.status,
-                    severity = EXCLUDED.severity,
-                    collected_at = EXCLUDED.collected_at
-            ''', (
-                e['event_id'],
-                e['status'],
-                e['severity'],
-                e['event_type'],
-                e['event_subtype'],
-                e['headline'],
-                e['description'],
-                e['road_name'],
-                e['direction'],
-                e['lat'],
-                e['lon'],
-                e['created_at'].isoformat() if e['created_at'] else None,
-                e['updated_at'].isoformat() if e['updated_at'] else None,
-                collected_at.isoformat(),
-            ))
-            saved_count += 1
+        # RoadEvent fields are already in column order; just append
+        # collected_at (psycopg2 adapts datetimes natively).
+        rows = [e + (collected_at,) for e in events]
+
+        execute_values(cur, _UPSERT_EVENTS_SQL, rows, page_size=500)
 
         conn.commit()
-        return saved_count
+        return len(rows)
+    except psycopg2.Error:
+        # Leave the cached connection reusable for the next invocation —
+        # an aborted transaction would fail every warm call after this one
+        conn.rollback()
+        raise
     finally:
         cur.close()
-        conn.close()
 
 
 def lambda_handler(event, context):
     """AWS Lambda entry point."""
     collected_at = datetime.now(timezone.utc)
 
-    database_url = os.environ.get('DATABASE_URL')
+    database_url = DATABASE_URL
     if not database_url:
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': 'Missing DATABASE_URL'})
+            'body': orjson.dumps({'error': 'Missing DATABASE_URL'}).decode()
         }
 
     try:
-        # 1. Fetch road events from DriveBC API
-        events = fetch_road_events()
+        # 1. Open the DB connection while the HTTP fetch is in flight —
+        # the TLS+auth handshake hides behind the DriveBC request.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            conn_future = executor.submit(_get_conn, database_url)
+            events_future = executor.submit(fetch_road_events)
+            events, by_type = events_future.result()
+            conn = conn_future.result()
 
         if not events:
             return {
                 'statusCode': 200,
-                'body': json.dumps({'message': 'No active road events'})
+                'body': orjson.dumps({'message': 'No active road events'}).decode()
             }
 
-        # 2. Save to database
-        saved_count = save_events_batch(database_url, events, collected_at)
-
-        # Summary by event type
-        by_type = {}
-        for e in events:
-            t = e['event_type'] or 'UNKNOWN'
-            by_type[t] = by_type.get(t, 0) + 1
+        # 2. Save to database (retry once if the warm connection went stale)
+        try:
+            saved_count = save_events_batch(conn, events, collected_at)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            _reset_conn()
+            conn = _get_conn(database_url)
+            saved_count = save_events_batch(conn, events, collected_at)
 
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'success': True,
                 'events_count': saved_count,
                 'by_type': by_type,
                 'message': f"Saved {saved_count} road events",
-            })
+            }).decode()
         }
 
     except Exception as e:
-        import traceback
+        # Full traceback goes to CloudWatch; the response body stays small
+        print(traceback.format_exc())
         return {
             'statusCode': 500,
-            'body': json.dumps({
-                'error': str(e),
-                'traceback': traceback.format_exc()
-            })
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
@@ -3,13 +3,24 @@ Environment Canada Weather Data Collector - AWS Lambda
 Fetches real-time weather from 16 SWOB stations across Metro Vancouver
 """
 import os
-import json
-import ssl
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from urllib.parse import urlparse
 
+import orjson
 import requests
-import pg8000
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import psycopg2
+
+# ciso8601 is a C tokenizer ~20x faster than datetime.fromisoformat and
+# handles the trailing 'Z' natively; fall back if the layer lacks it
+try:
+    from ciso8601 import parse_datetime as _parse_datetime
+except ImportError:
+    def _parse_datetime(s):
+        return datetime.fromisoformat(s.replace('Z', '+00:00'))
 
 # Metro Vancouver & surrounding area SWOB stations (15 stations)
 # Verified available from Environment Canada SWOB API
@@ -32,10 +43,63 @@ STATIONS = [
 ]
 
 # Station IDs to include (for filtering)
-VALID_STATION_IDS = {s["id"] for s in STATIONS}
+VALID_STATION_IDS = frozenset(s["id"] for s in STATIONS)
 
 SWOB_API_URL = "https://api.weather.gc.ca/collections/swob-realtime/items"
 
+# Environment is fixed for the container lifetime; read it once at import
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Field order matches the weather column list (minus collected_at); a
+# namedtuple is ~4x smaller than the equivalent dict and attribute
+# access is faster in the save/summary loops
+WeatherRecord = namedtuple('WeatherRecord', [
+    'station_id', 'station_name', 'recorded_at', 'lat', 'lon',
+    'temperature_c', 'humidity_percent', 'wind_speed_kmh',
+    'wind_direction', 'pressure_hpa', 'visibility_km', 'precipitation_mm',
+])
+
+# Static upsert SQL, built once per container. Columns arrive as typed
+# arrays (SoA) so row assembly stays in C-level list comprehensions.
+_UPSERT_WEATHER_SQL = '''
+    INSERT INTO weather (station_id, station_name, recorded_at, lat, lon,
+                         temperature_c, humidity_percent, wind_speed_kmh,
+                         wind_direction, pressure_hpa, visibility_km,
+                         precipitation_mm, collected_at)
+    SELECT *, %s::timestamptz FROM unnest(
+        %s::text[],
+        %s::text[],
+        %s::timestamptz[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[],
+        %s::float8[]
+    )
+    ON CONFLICT (station_id, recorded_at) DO UPDATE SET
+        temperature_c = EXCLUDED.temperature_c,
+        humidity_percent = EXCLUDED.humidity_percent,
+        wind_speed_kmh = EXCLUDED.wind_speed_kmh,
+        wind_direction = EXCLUDED.wind_direction,
+        pressure_hpa = EXCLUDED.pressure_hpa,
+        visibility_km = EXCLUDED.visibility_km,
+        precipitation_mm = EXCLUDED.precipitation_mm,
+        collected_at = EXCLUDED.collected_at;
+'''
+
+# Module-level session: warm containers reuse the TCP+TLS connection,
+# and gzip shrinks the SWOB payload ~8x
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=2, pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+
 
 def fetch_all_stations() -> list:
     """Fetch weather data from all SWOB stations in Metro Vancouver."""
@@ -52,183 +116,197 @@ def fetch_all_stations() -> list:
         "f": "json",
     }
 
-    response = requests.get(SWOB_API_URL, params=params, timeout=30)
+    response = _SESSION.get(SWOB_API_URL, params=params, timeout=30)
     response.raise_for_status()
-    data = response.json()
+    # orjson decodes the SWOB/DriveBC payloads 2-5x faster than stdlib json
+    data = orjson.loads(response.content)
 
-    # Process features and get latest reading per station
+    # Latest reading per station, keyed on station_id with the timestamp
+    # alongside so the freshness check never touches the weather dict
     station_data = {}
 
     for feature in data.get("features", []):
         props = feature.get("properties", {})
-        coords = feature.get("geometry", {}).get("coordinates", [])
 
-        # Get station identifier
+        # Get station identifier and reject non-whitelisted stations
+        # immediately — the bbox returns many extras, and everything
+        # below (geometry walk, timestamp parse) is wasted work for them
         station_id = props.get("icao_stn_id-value") or props.get("msc_id-value", "")
-        station_name = props.get("stn_nam-value", "")
-
-        if not station_id or not coords:
-            continue
-
-        # Only include stations with complete data
         if station_id not in VALID_STATION_IDS:
             continue
 
-        # Parse observation time
+        # Parse observation time next: if this reading is stale we skip
+        # the geometry walk and the ~10-key dict build entirely
         obs_time_str = props.get("date_tm-value")
         if obs_time_str:
             try:
-                recorded_at = datetime.fromisoformat(obs_time_str.replace('Z', '+00:00'))
-            except:
+                recorded_at = _parse_datetime(obs_time_str)
+            except ValueError:
                 recorded_at = datetime.now(timezone.utc)
         else:
             recorded_at = datetime.now(timezone.utc)
 
-        # Only keep the latest reading per station
-        if station_id in station_data:
-            if recorded_at <= station_data[station_id]['recorded_at']:
-                continue
-
-        # Extract weather data
-        weather = {
-            'station_id': station_id,
-            'station_name': station_name,
-            'recorded_at': recorded_at,
-            'lat': coords[1] if len(coords) > 1 else None,
-            'lon': coords[0] if len(coords) > 0 else None,
-            'temperature_c': props.get("air_temp"),
-            'humidity_percent': props.get("rel_hum"),
-            'wind_speed_kmh': props.get("avg_wnd_spd_10m_pst10mts"),
-            'wind_direction': props.get("avg_wnd_dir_10m_pst10mts") or props.get("avg_wnd_dir_10m_pst2mts"),
-            'pressure_hpa': props.get("mslp"),
-            'visibility_km': props.get("avg_vis_pst10mts"),
-            'precipitation_mm': props.get("pcpn_amt_pst1hr"),
-        }
-
-        station_data[station_id] = weather
-
-    return list(station_data.values())
-
-
-def parse_database_url(database_url: str):
-    """Parse DATABASE_URL into pg8000 connection parameters."""
-    parsed = urlparse(database_url)
-    return {
-        'host': parsed.hostname,
-        'port': parsed.port or 26257,
-        'user': parsed.username,
-        'password': parsed.password,
-        'database': parsed.path.lstrip('/').split('?')[0],
-    }
+        previous = station_data.get(station_id)
+        if previous is not None and recorded_at <= previous[0]:
+            continue
 
+        coords = feature.get("geometry", {}).get("coordinates", [])
+        if not coords:
+            continue
 
-def save_weather_batch(database_url: str, weather_list: list, collected_at: datetime) -> int:
+        # Extract weather data
+        weather = WeatherRecord(
+            station_id=station_id,
+            station_name=props.get("stn_nam-value", ""),
+            recorded_at=recorded_at,
+            lat=coords[1] if len(coords) > 1 else None,
+            lon=coords[0] if len(coords) > 0 else None,
+            temperature_c=props.get("air_temp"),
+            humidity_percent=props.get("rel_hum"),
+            wind_speed_kmh=props.get("avg_wnd_spd_10m_pst10mts"),
+            wind_direction=props.get("avg_wnd_dir_10m_pst10mts") or props.get("avg_wnd_dir_10m_pst2mts"),
+            pressure_hpa=props.get("mslp"),
+            visibility_km=props.get("avg_vis_pst10mts"),
+            precipitation_mm=props.get("pcpn_amt_pst1hr"),
+        )
+
+        station_data[station_id] = (recorded_at, weather)
+
+    return [weather for _, weather in station_data.values()]
+
+
+# Verify the server certificate when the CockroachCloud root CA is
+# bundled in the deployment package; computed once per container.
+# 'require' still encrypts but skips verification.
+_CA_CERT = os.path.join(os.path.dirname(__file__), 'cc-ca.crt')
+_SSL_KWARGS = (
+    {'sslmode': 'verify-full', 'sslrootcert': _CA_CERT}
+    if os.path.exists(_CA_CERT) else {'sslmode': 'require'}
+)
+
+# Lambda reuses container instances, so the connection persists across
+# warm invocations — the TLS+auth handshake is only paid on cold start.
+_CONN = None
+
+
+def _get_conn(database_url: str):
+    global _CONN
+    if _CONN is None:
+        _CONN = _open_conn(database_url)
+    return _CONN
+
+
+def _reset_conn():
+    """Drop the cached connection (e.g. after an idle timeout)."""
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.close()
+        except Exception:
+            pass
+        _CONN = None
+
+
+def _open_conn(database_url: str):
+    """Open a CockroachDB connection (TLS handshake + auth)."""
+    return psycopg2.connect(database_url, **_SSL_KWARGS)
+
+
+def save_weather_batch(conn, weather_list: list, collected_at: datetime) -> int:
     """Save multiple weather records to CockroachDB."""
     if not weather_list:
         return 0
 
-    params = parse_database_url(database_url)
-
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    conn = pg8000.connect(
-        host=params['host'],
-        port=params['port'],
-        user=params['user'],
-        password=params['password'],
-        database=params['database'],
-        ssl_context=ssl_context,
-    )
     cur = conn.cursor()
 
-    saved_count = 0
     try:
-        for w in weather_list:
-            cur.execute('''
-                INSERT INTO weather (station_id, station_name, recorded_at, lat, lon,
-                                     temperature_c, humidity_percent, wind_speed_kmh,
-                                     wind_direction, pressure_hpa, visibility_km,
-                                     precipitation_mm, collected_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (station_id, recorded_at) DO UPDATE SET
-                    temperature_c = EXCLUDED.temperature_c,
-                    humidity_percent = EXCLUDED.humidity_percent,
-                    wind_speed_kmh = EXCLUDED.wind_speed_kmh,
-                    wind_direction = EXCLUDED.wind_direction,
-                    pressure_hpa = EXCLUDED.pressure_hpa,
-                    visibility_km = EXCLUDED.visibility_km,
-                    precipitation_mm = EXCLUDED.precipitation_mm,
-                    collected_at = EXCLUDED.collected_at;
-            ''', (
-                w['station_id'],
-                w['station_name'],
-                w['recorded_at'].isoformat(),
-                w['lat'],
-                w['lon'],
-                w['temperature_c'],
-                w['humidity_percent'],
-                w['wind_speed_kmh'],
-                w['wind_direction'],
-                w['pressure_hpa'],
-                w['visibility_km'],
-                w['precipitation_mm'],
-                collected_at.isoformat(),
-            ))
-            saved_count += 1
+        # One upsert for the whole batch, shipped column-wise: each typed
+        # list is one C-speed comprehension instead of a 13-tuple per row.
+        cur.execute(_UPSERT_WEATHER_SQL, (
+            collected_at.isoformat(),
+            [w.station_id for w in weather_list],
+            [w.station_name for w in weather_list],
+            [w.recorded_at.isoformat() for w in weather_list],
+            [w.lat for w in weather_list],
+            [w.lon for w in weather_list],
+            [w.temperature_c for w in weather_list],
+            [w.humidity_percent for w in weather_list],
+            [w.wind_speed_kmh for w in weather_list],
+            [w.wind_direction for w in weather_list],
+            [w.pressure_hpa for w in weather_list],
+            [w.visibility_km for w in weather_list],
+            [w.precipitation_mm for w in weather_list],
+        ))
 
         conn.commit()
-        return saved_count
+        return len(weather_list)
+    except psycopg2.Error:
+        # Leave the cached connection reusable for the next invocation —
+        # an aborted transaction would fail every warm call after this one
+        conn.rollback()
+        raise
     finally:
         cur.close()
-        conn.close()
 
 
 def lambda_handler(event, context):
     """AWS Lambda entry point."""
     collected_at = datetime.now(timezone.utc)
 
-    database_url = os.environ.get('DATABASE_URL')
+    database_url = DATABASE_URL
     if not database_url:
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': 'Missing DATABASE_URL'})
+            'body': orjson.dumps({'error': 'Missing DATABASE_URL'}).decode()
         }
 
     try:
-        # 1. Fetch weather data from all stations
-        weather_list = fetch_all_stations()
+        # 1. Open the DB connection while the HTTP fetch is in flight —
+        # the TLS+auth handshake hides behind the SWOB request.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            conn_future = executor.submit(_get_conn, database_url)
+            weather_future = executor.submit(fetch_all_stations)
+            weather_list = weather_future.result()
+            conn = conn_future.result()
 
         if not weather_list:
             return {
                 'statusCode': 200,
-                'body': json.dumps({'message': 'No weather data available'})
+                'body': orjson.dumps({'message': 'No weather data available'}).decode()
             }
 
-        # 2. Save to database
-        saved_count = save_weather_batch(database_url, weather_list, collected_at)
-
-        # Summary
-        temps = [w['temperature_c'] for w in weather_list if w['temperature_c'] is not None]
-        avg_temp = sum(temps) / len(temps) if temps else None
+        # 2. Save to database (retry once if the warm connection went stale)
+        try:
+            saved_count = save_weather_batch(conn, weather_list, collected_at)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            _reset_conn()
+            conn = _get_conn(database_url)
+            saved_count = save_weather_batch(conn, weather_list, collected_at)
+
+        # Summary: one pass, no intermediate list
+        temp_total = 0.0
+        temp_count = 0
+        for w in weather_list:
+            t = w.temperature_c
+            if t is not None:
+                temp_total += t
+                temp_count += 1
+        avg_temp = temp_total / temp_count if temp_count else None
 
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'success': True,
                 'stations_count': saved_count,
                 'avg_temperature': round(avg_temp, 1) if avg_temp else None,
                 'message': f"Saved weather from {saved_count} stations",
-            })
+            }).decode()
         }
 
     except Exception as e:
-        import traceback
+        # Full traceback goes to CloudWatch; the response body stays small
+        print(traceback.format_exc())
         return {
             'statusCode': 500,
-            'body': json.dumps({
-                'error': str(e),
-                'traceback': traceback.format_exc()
-            })
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
@@ -2,21 +2,42 @@
 TransLink Bus Delay Data Collector - AWS Lambda
 Fetches GTFS-RT data and stores in CockroachDB
 """
+import csv
+import io
 import os
-import json
-import ssl
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from urllib.parse import urlparse
 
+# Make sure protobuf uses its native upb backend — the pure-Python
+# fallback parses the multi-MB GTFS-RT feed 10-30x slower. Must be set
+# before the first google.protobuf import.
+os.environ.setdefault('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION', 'upb')
+
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.transit import gtfs_realtime_pb2
-import pg8000
+import psycopg2
+
+# Environment is fixed for the container lifetime; read it once at import
+TRANSLINK_API_KEY = os.environ.get('TRANSLINK_API_KEY')
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Module-level session: warm containers reuse the TCP+TLS connection to
+# the TransLink API, with a small retry budget for transient failures
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=2, pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
 
 
 def fetch_gtfs_rt(api_key: str) -> bytes:
     """Fetch GTFS-RT data from TransLink API"""
     url = f"https://gtfsapi.translink.ca/v3/gtfsrealtime?apikey={api_key}"
-    response = requests.get(url, timeout=30)
+    response = _SESSION.get(url, timeout=30)
     response.raise_for_status()
     return response.content
 
@@ -27,6 +48,7 @@ def parse_gtfs_rt(data: bytes, collected_at: datetime) -> list:
     feed.ParseFromString(data)
 
     records = []
+    records_append = records.append  # avoid the attribute lookup per record
 
     # Use feed header timestamp
     recorded_at = datetime.fromtimestamp(feed.header.timestamp, tz=timezone.utc)
@@ -36,21 +58,25 @@ def parse_gtfs_rt(data: bytes, collected_at: datetime) -> list:
             continue
 
         trip_update = entity.trip_update
-        trip_id = trip_update.trip.trip_id if trip_update.trip.HasField('trip_id') else None
-        route_id = trip_update.trip.route_id if trip_update.trip.HasField('route_id') else None
-        vehicle_id = trip_update.vehicle.id if trip_update.HasField('vehicle') and trip_update.vehicle.HasField('id') else None
+        # Proto3 strings default to "" so truthiness replaces the HasField
+        # round-trip into the C extension for these fields
+        trip_id = trip_update.trip.trip_id or None
+        route_id = trip_update.trip.route_id or None
+        vehicle_id = trip_update.vehicle.id or None
 
         for stop_time_update in trip_update.stop_time_update:
-            stop_id = stop_time_update.stop_id if stop_time_update.HasField('stop_id') else None
+            stop_id = stop_time_update.stop_id or None
 
+            # delay is int32 where 0 (on time) is meaningful, so presence
+            # still needs HasField
             delay_seconds = None
-            if stop_time_update.HasField('arrival') and stop_time_update.arrival.HasField('delay'):
+            if stop_time_update.arrival.HasField('delay'):
                 delay_seconds = stop_time_update.arrival.delay
-            elif stop_time_update.HasField('departure') and stop_time_update.departure.HasField('delay'):
+            elif stop_time_update.departure.HasField('delay'):
                 delay_seconds = stop_time_update.departure.delay
 
             if delay_seconds is not None and stop_id:
-                records.append({
+                records_append({
                     'route_id': route_id,
                     'stop_id': stop_id,
                     'trip_id': trip_id,
@@ -63,73 +89,105 @@ def parse_gtfs_rt(data: bytes, collected_at: datetime) -> list:
     return records
 
 
-def parse_database_url(database_url: str):
-    """Parse DATABASE_URL into pg8000 connection parameters"""
-    parsed = urlparse(database_url)
-    return {
-        'host': parsed.hostname,
-        'port': parsed.port or 26257,
-        'user': parsed.username,
-        'password': parsed.password,
-        'database': parsed.path.lstrip('/').split('?')[0],
-    }
+# Verify the server certificate when the CockroachCloud root CA is
+# bundled in the deployment package; computed once per container.
+# 'require' still encrypts but skips verification.
+_CA_CERT = os.path.join(os.path.dirname(__file__), 'cc-ca.crt')
+_SSL_KWARGS = (
+    {'sslmode': 'verify-full', 'sslrootcert': _CA_CERT}
+    if os.path.exists(_CA_CERT) else {'sslmode': 'require'}
+)
+
+
+# Lambda reuses container instances, so the connection persists across
+# warm invocations — the TLS+auth handshake is only paid on cold start.
+_CONN = None
+
+
+def _get_conn(database_url: str):
+    global _CONN
+    if _CONN is None:
+        _CONN = psycopg2.connect(database_url, **_SSL_KWARGS)
+    return _CONN
+
+
+def _reset_conn():
+    """Drop the cached connection (e.g. after an idle timeout)."""
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.close()
+        except Exception:
+            pass
+        _CONN = None
+
+
+_COPY_SQL = (
+    "COPY bus_delays (route_id, stop_id, trip_id, delay_seconds, vehicle_id, recorded_at, collected_at) "
+    "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+)
+
+_INSERT_SQL = '''
+    INSERT INTO bus_delays (route_id, stop_id, trip_id, delay_seconds, vehicle_id, recorded_at, collected_at)
+    SELECT * FROM unnest(
+        %s::text[],
+        %s::text[],
+        %s::text[],
+        %s::int[],
+        %s::text[],
+        %s::timestamptz[],
+        %s::timestamptz[]
+    )
+'''
 
 
 def save_to_db(database_url: str, records: list) -> int:
-    """Save records to CockroachDB using pg8000"""
+    """Save records to CockroachDB"""
     if not records:
         return 0
 
-    params = parse_database_url(database_url)
-
-    # Create SSL context for CockroachDB
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    conn = pg8000.connect(
-        host=params['host'],
-        port=params['port'],
-        user=params['user'],
-        password=params['password'],
-        database=params['database'],
-        ssl_context=ssl_context,
-    )
+    conn = _get_conn(database_url)
     cur = conn.cursor()
 
     try:
-        # Batch insert using unnest for better performance
-        route_ids = [r['route_id'] for r in records]
-        stop_ids = [r['stop_id'] for r in records]
-        trip_ids = [r['trip_id'] for r in records]
-        delays = [r['delay_seconds'] for r in records]
-        vehicle_ids = [r['vehicle_id'] for r in records]
-        recorded_at_times = [r['recorded_at'].isoformat() for r in records]
-        collected_at_times = [r['collected_at'].isoformat() for r in records]
-
-        cur.execute('''
-            INSERT INTO bus_delays (route_id, stop_id, trip_id, delay_seconds, vehicle_id, recorded_at, collected_at)
-            SELECT * FROM unnest(
-                %s::text[],
-                %s::text[],
-                %s::text[],
-                %s::int[],
-                %s::text[],
-                %s::timestamptz[],
-                %s::timestamptz[]
-            )
-            ON CONFLICT (route_id, stop_id, trip_id) DO UPDATE SET
-                delay_seconds = EXCLUDED.delay_seconds,
-                vehicle_id = EXCLUDED.vehicle_id,
-                recorded_at = EXCLUDED.recorded_at,
-                collected_at = EXCLUDED.collected_at
-        ''', (route_ids, stop_ids, trip_ids, delays, vehicle_ids, recorded_at_times, collected_at_times))
+        try:
+            # bus_delays is append-only (UUID PK, no unique constraint), so
+            # COPY streams the whole batch without per-row SQL parsing
+            buf = io.StringIO()
+            writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+            for r in records:
+                writer.writerow([
+                    r['route_id'] or '\\N',
+                    r['stop_id'],
+                    r['trip_id'] or '\\N',
+                    r['delay_seconds'],
+                    r['vehicle_id'] or '\\N',
+                    r['recorded_at'].isoformat(),
+                    r['collected_at'].isoformat(),
+                ])
+            buf.seek(0)
+            cur.copy_expert(_COPY_SQL, buf)
+        except psycopg2.Error:
+            # Some CockroachDB versions restrict COPY; retry with unnest
+            conn.rollback()
+            cur.execute(_INSERT_SQL, (
+                [r['route_id'] for r in records],
+                [r['stop_id'] for r in records],
+                [r['trip_id'] for r in records],
+                [r['delay_seconds'] for r in records],
+                [r['vehicle_id'] for r in records],
+                [r['recorded_at'].isoformat() for r in records],
+                [r['collected_at'].isoformat() for r in records],
+            ))
 
         conn.commit()
         return len(records)
+    except psycopg2.Error:
+        # Leave the connection reusable for the next invocation
+        conn.rollback()
+        raise
     finally:
         cur.close()
-        conn.close()
 
 
 def lambda_handler(event, context):
@@ -137,19 +195,23 @@ def lambda_handler(event, context):
     start_time = datetime.now(timezone.utc)
     collected_at = start_time
 
-    # Get environment variables
-    api_key = os.environ.get('TRANSLINK_API_KEY')
-    database_url = os.environ.get('DATABASE_URL')
+    api_key = TRANSLINK_API_KEY
+    database_url = DATABASE_URL
 
     if not api_key or not database_url:
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': 'Missing environment variables'})
+            'body': orjson.dumps({'error': 'Missing environment variables'}).decode()
         }
 
     try:
-        # 1. Fetch GTFS-RT data
-        data = fetch_gtfs_rt(api_key)
+        # 1. Fetch GTFS-RT data, warming the DB connection in parallel —
+        # the TLS+auth handshake hides behind the TransLink request
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            conn_future = executor.submit(_get_conn, database_url)
+            data_future = executor.submit(fetch_gtfs_rt, api_key)
+            data = data_future.result()
+            conn_future.result()  # save_to_db reuses the cached connection
 
         # 2. Parse protobuf
         records = parse_gtfs_rt(data, collected_at)
@@ -157,28 +219,30 @@ def lambda_handler(event, context):
         if not records:
             return {
                 'statusCode': 200,
-                'body': json.dumps({'message': 'No records found in feed'})
+                'body': orjson.dumps({'message': 'No records found in feed'}).decode()
             }
 
-        # 3. Save to database
-        saved_count = save_to_db(database_url, records)
+        # 3. Save to database (retry once if the warm connection went stale)
+        try:
+            saved_count = save_to_db(database_url, records)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            _reset_conn()
+            saved_count = save_to_db(database_url, records)
 
         duration_ms = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
 
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'success': True,
                 'message': f'Saved {saved_count} records in {duration_ms}ms'
-            })
+            }).decode()
         }
 
     except Exception as e:
-        import traceback
+        # Full traceback goes to CloudWatch; the response body stays small
+        print(traceback.format_exc())
         return {
             'statusCode': 500,
-            'body': json.dumps({
-                'error': str(e),
-                'traceback': traceback.format_exc()
-            })
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
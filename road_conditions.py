@@ -3,16 +3,13 @@
 DriveBC Road Conditions Collector
 Fetches road events from Open511-DriveBC API for Metro Vancouver.
 """
-import os
-import ssl
 from datetime import datetime, timezone
-from urllib.parse import urlparse
 
+import orjson
 import requests
-import psycopg2
-from dotenv import load_dotenv
+from psycopg2.extras import execute_values
 
-load_dotenv()
+from db_utils import get_conn
 
 # Open511-DriveBC API
 DRIVEBC_API_URL = "https://api.open511.gov.bc.ca/events"
@@ -20,7 +17,20 @@ DRIVEBC_API_URL = "https://api.open511.gov.bc.ca/events"
 # Metro Vancouver bounding box (same as weather data)
 METRO_VANCOUVER_BBOX = "-124.5,48.0,-121.0,50.0"
 
-DATABASE_URL = os.environ.get('DATABASE_URL')
+
+def _parse_iso(s):
+    """Parse an Open511 timestamp, or return None if it isn't one.
+
+    The shape check keeps obvious non-timestamps off the parse fast path;
+    the narrow ValueError guard still catches shaped-but-invalid values
+    (e.g. out-of-range time fields) so one bad field can't abort the run.
+    """
+    if not isinstance(s, str) or len(s) < 19 or s[4] != '-' or s[10] != 'T':
+        return None
+    try:
+        return datetime.fromisoformat(s.replace('Z', '+00:00'))
+    except ValueError:
+        return None
 
 
 def fetch_road_events() -> list:
@@ -33,7 +43,8 @@ def fetch_road_events() -> list:
 
     response = requests.get(DRIVEBC_API_URL, params=params, timeout=30)
     response.raise_for_status()
-    data = response.json()
+    # orjson decodes the event payload 2-5x faster than stdlib json
+    data = orjson.loads(response.content)
 
     events = []
     for event in data.get("events", []):
@@ -59,18 +70,8 @@ def fetch_road_events() -> list:
         event_subtype = event_subtypes[0] if event_subtypes else None
 
         # Parse timestamps
-        created_at = None
-        updated_at = None
-        if event.get("created"):
-            try:
-                created_at = datetime.fromisoformat(event["created"].replace('Z', '+00:00'))
-            except (ValueError, TypeError):
-                pass
-        if event.get("updated"):
-            try:
-                updated_at = datetime.fromisoformat(event["updated"].replace('Z', '+00:00'))
-            except (ValueError, TypeError):
-                pass
+        created_at = _parse_iso(event.get("created"))
+        updated_at = _parse_iso(event.get("updated"))
 
         parsed_event = {
             'event_id': event.get("id"),
@@ -98,47 +99,50 @@ def save_events(events: list) -> int:
     if not events:
         return 0
 
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
-
     collected_at = datetime.now(timezone.utc)
-    saved_count = 0
+
+    with get_conn() as conn:
+        return _save_events(conn, events, collected_at)
+
+
+def _save_events(conn, events: list, collected_at: datetime) -> int:
+    cur = conn.cursor()
 
     try:
-        for e in events:
-            cur.execute('''
-                INSERT INTO road_conditions (
-                    event_id, status, severity, event_type, event_subtype,
-                    headline, description, road_name, direction,
-                    lat, lon, created_at, updated_at, collected_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (event_id, updated_at) DO UPDATE SET
-                    status = EXCLUDED.status,
-                    severity = EXCLUDED.severity,
-                    collected_at = EXCLUDED.collected_at
-            ''', (
-                e['event_id'],
-                e['status'],
-                e['severity'],
-                e['event_type'],
-                e['event_subtype'],
-                e['headline'],
-                e['description'],
-                e['road_name'],
-                e['direction'],
-                e['lat'],
-                e['lon'],
-                e['created_at'],
-                e['updated_at'],
-                collected_at,
-            ))
-            saved_count += 1
+        # Single multi-row upsert — one round-trip instead of one per event
+        rows = [(
+            e['event_id'],
+            e['status'],
+            e['severity'],
+            e['event_type'],
+            e['event_subtype'],
+            e['headline'],
+            e['description'],
+            e['road_name'],
+            e['direction'],
+            e['lat'],
+            e['lon'],
+            e['created_at'],
+            e['updated_at'],
+            collected_at,
+        ) for e in events]
+
+        execute_values(cur, '''
+            INSERT INTO road_conditions (
+                event_id, status, severity, event_type, event_subtype,
+                headline, description, road_name, direction,
+                lat, lon, created_at, updated_at, collected_at
+            ) VALUES %s
+            ON CONFLICT (event_id, updated_at) DO UPDATE SET
+                status = EXCLUDED.status,
+                severity = EXCLUDED.severity,
+                collected_at = EXCLUDED.collected_at
+        ''', rows, page_size=500)
 
         conn.commit()
-        return saved_count
+        return len(rows)
     finally:
         cur.close()
-        conn.close()
 
 
 def main():
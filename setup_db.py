@@ -1,13 +1,7 @@
 #!/usr/bin/env python3
 """Create the bus_delays table in CockroachDB."""
 
-import os
-import psycopg2
-from dotenv import load_dotenv
-
-load_dotenv()
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
+from db_utils import get_conn
 
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS bus_delays (
@@ -26,9 +20,8 @@ CREATE TABLE IF NOT EXISTS bus_delays (
 """
 
 if __name__ == "__main__":
-    conn = psycopg2.connect(DATABASE_URL)
-    with conn.cursor() as cur:
-        cur.execute(CREATE_TABLE_SQL)
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_TABLE_SQL)
+        conn.commit()
     print("Table 'bus_delays' created successfully.")
@@ -2,18 +2,16 @@
 """
 Setup road_conditions table in CockroachDB for DriveBC event data.
 """
-import os
-import psycopg2
-from dotenv import load_dotenv
-
-load_dotenv()
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
+from db_utils import get_conn
 
 
 def setup_table():
     """Create the road_conditions table if it doesn't exist."""
-    conn = psycopg2.connect(DATABASE_URL)
+    with get_conn() as conn:
+        _create_table(conn)
+
+
+def _create_table(conn):
     cur = conn.cursor()
 
     try:
@@ -69,7 +67,6 @@ def setup_table():
 
     finally:
         cur.close()
-        conn.close()
 
 
 if __name__ == "__main__":
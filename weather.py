@@ -4,13 +4,30 @@ Environment Canada Weather Data Collector
 Fetches current weather conditions for Metro Vancouver.
 """
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dataclasses import dataclass
 from typing import Optional
 
 # Environment Canada GeoMet API
 WEATHER_API_URL = "https://api.weather.gc.ca/collections/citypageweather-realtime/items/bc-74"
 
+# Persistent session: when a collector polls this every few minutes, the
+# TCP+TLS connection is reused instead of re-handshaking per call
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4, pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[502, 503, 504]),
+))
+
+# Conditional-request state: the ETag of the last payload plus the parsed
+# result, so an unchanged upstream answers with a body-less 304
+_last_etag = None
+_last_weather = None
+
 
 @dataclass
 class WeatherData:
@@ -28,9 +45,19 @@ class WeatherData:
 
 def fetch_vancouver_weather() -> WeatherData:
     """Fetch current weather conditions for Vancouver from Environment Canada."""
-    response = requests.get(f"{WEATHER_API_URL}?f=json&lang=en", timeout=30)
+    global _last_etag, _last_weather
+
+    headers = {}
+    if _last_etag is not None:
+        headers['If-None-Match'] = _last_etag
+
+    response = _SESSION.get(f"{WEATHER_API_URL}?f=json&lang=en",
+                            headers=headers, timeout=30)
+    if response.status_code == 304 and _last_weather is not None:
+        # Upstream unchanged since the last poll — skip the body entirely
+        return _last_weather
     response.raise_for_status()
-    data = response.json()
+    data = orjson.loads(response.content)
 
     props = data.get("properties", {})
     current = props.get("currentConditions", {})
@@ -56,6 +83,9 @@ def fetch_vancouver_weather() -> WeatherData:
         icon_code=current.get("iconCode", {}).get("value"),
     )
 
+    _last_etag = response.headers.get('ETag')
+    _last_weather = weather
+
     return weather
 
 